@@ -1,41 +1,90 @@
 import subprocess
 import time
-from datetime import datetime
-import csv
+import io
+import operator
+import os
+import queue
+import re
 import sys
+import threading
 from collections import defaultdict
+from types import MappingProxyType
 
 class PhoneRebootTester:
-    def __init__(self, test_cycles=1000, output_file='reboot_test_results.csv'):
+    # 错误类型分类（只读，所有实例共享）
+    _ERROR_TYPES = MappingProxyType({
+        "adb_connection": "ADB连接失败",
+        "reboot_timeout": "重启命令超时",
+        "boot_timeout": "启动超时",
+        "device_not_found": "设备未连接",
+        "boot_failure": "启动失败",
+        "unknown_error": "未知错误"
+    })
+    # CSV列顺序；status取值: REBOOT_FAIL(重启命令失败) / BOOT_FAIL(重启后未能启动完成) / OK
+    _FIELDNAMES = (
+        'cycle',
+        'start_time',
+        'end_time',
+        'status',
+        'error_type',
+        'error_message',
+        'duration_seconds'
+    )
+    # 错误关键字按优先级排列，从字符串开头用前瞻匹配，保证优先级与出现位置无关
+    _ERROR_RE = re.compile(
+        r'(?=.*?(?P<device_not_found>device not found))'
+        r'|(?=.*?(?P<reboot_timeout>timed? ?out))'
+        r'|(?=.*?(?P<adb_connection>error|fail))',
+        re.IGNORECASE | re.DOTALL
+    )
+    # 设备端等待启动完成：轮询间隔从0.25秒指数增长到1秒；旧系统的sleep不支持小数时退回1秒
+    # 结束时输出OK作为成功标记：旧版adb shell协议在连接断开时也可能返回0
+    _BOOT_WAIT_SCRIPT = (
+        'd=0.25; '
+        'while [ "$(getprop sys.boot_completed)" != "1" ]; do '
+        'sleep $d 2>/dev/null || sleep 1; '
+        'case $d in 0.25) d=0.5;; *) d=1;; esac; '
+        'done; echo OK'
+    )
+
+    def __init__(self, test_cycles=1000, output_file='reboot_test_results.csv', cooldown_seconds=0,
+                 fsync_on_close=False):
         """
         初始化重启测试器
         :param test_cycles: 测试循环次数 (默认1000次)
         :param output_file: 结果输出文件名 (默认'reboot_test_results.csv')
+        :param cooldown_seconds: 每次循环之间的冷却时间，单位秒 (默认0，启动完成后立即开始下一次)
+        :param fsync_on_close: 测试结束时是否将结果文件fsync到磁盘 (默认False)
         """
         self.test_cycles = test_cycles
         self.output_file = output_file
-        self.results = []
+        self.cooldown_seconds = cooldown_seconds
+        self.fsync_on_close = fsync_on_close
+        self._total = 0    # 已完成的测试次数
+        self._success = 0  # 重启且启动成功的次数
         self.current_cycle = 0
         self.device_serial = None
         self.error_stats = defaultdict(int)  # 用于统计各类错误出现次数
         
-        # 初始化错误类型分类
-        self.error_types = {
-            "adb_connection": "ADB连接失败",
-            "reboot_timeout": "重启命令超时",
-            "boot_timeout": "启动超时",
-            "device_not_found": "设备未连接",
-            "boot_failure": "启动失败",
-            "unknown_error": "未知错误"
-        }
-        
         self._check_adb()
         self._check_device()
 
+        # 结果文件只打开一次，每个循环追加一行，避免反复重写整个文件
+        # 显式使用64KB的BufferedWriter，由操作系统决定何时写盘，测试过程中不主动flush/fsync
+        self._csv_raw = open(self.output_file, 'wb', buffering=0)
+        self._csv_buf = io.BufferedWriter(self._csv_raw, buffer_size=65536)
+        self._csv_fh = io.TextIOWrapper(self._csv_buf, encoding='utf-8-sig', newline='', write_through=False)
+        self._csv_fh.write(','.join(self._FIELDNAMES) + '\r\n')
+
+        # 后台线程负责写文件，主循环只把结果放入队列，不在磁盘I/O上阻塞
+        self._q = queue.Queue(maxsize=1024)
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+
     def _check_adb(self):
         """检查ADB是否安装并可用"""
         try:
-            subprocess.run(['adb', 'version'], check=True, capture_output=True)
+            subprocess.run(['adb', 'version'], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         except (subprocess.CalledProcessError, FileNotFoundError):
             print("错误: ADB未找到或不可用。请安装Android SDK并确保adb在PATH中。")
             sys.exit(1)
@@ -52,18 +101,28 @@ class PhoneRebootTester:
             print("警告: 检测到多个设备，将使用第一个设备:", devices[0])
 
         self.device_serial = devices[0]
+        self._adb_prefix = ('adb', '-s', self.device_serial)
+        # 每个循环固定使用的几条命令，提前拼好参数
+        self._argv_reboot = self._adb_prefix + ('reboot',)
+        self._argv_wait_for_device = self._adb_prefix + ('wait-for-device',)
+        self._argv_boot_completed = self._adb_prefix + ('shell', self._BOOT_WAIT_SCRIPT)
         print(f"已连接设备: {self.device_serial}")
 
     def _execute_adb_command(self, command, timeout=30):
-        """执行ADB命令并返回结果"""
-        full_command = ['adb', '-s', self.device_serial] + command
+        """
+        执行任意ADB命令并返回其输出（通用版本，重启循环使用专门的_cmd_*方法）
+        子进程运行在独立会话中，Ctrl+C不会直接打断adb；中断时由subprocess.run负责结束子进程
+        """
+        full_command = self._adb_prefix + tuple(command)
         try:
             result = subprocess.run(
                 full_command,
                 check=True,
-                capture_output=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 text=True,
-                timeout=timeout
+                timeout=timeout,
+                start_new_session=True
             )
             return True, result.stdout.strip()
         except subprocess.CalledProcessError as e:
@@ -76,33 +135,140 @@ class PhoneRebootTester:
 
     def _classify_error(self, error_msg):
         """分类识别错误类型"""
-        error_msg = error_msg.lower()
-        if "device not found" in error_msg:
-            return "device_not_found"
-        elif "timeout" in error_msg or "timed out" in error_msg:
-            return "reboot_timeout"
-        elif "error" in error_msg or "fail" in error_msg:
-            return "adb_connection"
-        else:
-            return "unknown_error"
+        m = self._ERROR_RE.match(error_msg)
+        return m.lastgroup if m else "unknown_error"
 
-    def _wait_for_boot_completion(self, timeout=180):
-        """等待设备启动完成"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            success, output = self._execute_adb_command(['shell', 'getprop', 'sys.boot_completed'], timeout=10)
-            if success and output == '1':
+    def _cmd_reboot(self):
+        """执行adb reboot，不读取输出，失败时根据stderr分类错误"""
+        try:
+            subprocess.run(
+                self._argv_reboot,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=30,
+                start_new_session=True
+            )
+            return True, ''
+        except subprocess.CalledProcessError as e:
+            return False, self._classify_error(e.stderr.strip())
+        except subprocess.TimeoutExpired:
+            return False, "reboot_timeout"
+        except Exception:
+            return False, "unknown_error"
+
+    def _cmd_wait_for_device(self, timeout):
+        """阻塞等待设备重新上线，由adb服务端等待，无需轮询；失败时根据stderr分类错误"""
+        try:
+            subprocess.run(
+                self._argv_wait_for_device,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=timeout,
+                start_new_session=True
+            )
+            return True, ''
+        except subprocess.CalledProcessError as e:
+            return False, self._classify_error(e.stderr.strip())
+        except subprocess.TimeoutExpired:
+            return False, "boot_timeout"
+        except Exception:
+            return False, "unknown_error"
+
+    def _cmd_boot_completed(self, timeout):
+        """
+        在设备端循环检查sys.boot_completed，整个等待只占用一个adb进程
+        每次重启都会断开adb shell连接，常驻shell无法跨循环复用，因此每次启动等待单独开一个shell
+        """
+        try:
+            result = subprocess.run(
+                self._argv_boot_completed,
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                timeout=timeout,
+                start_new_session=True
+            )
+            # 只有看到结束标记才算启动完成，否则视为连接中途断开
+            if result.stdout.strip() == 'OK':
                 return True, "boot_success"
-            time.sleep(5)
-        return False, "boot_timeout"
+            return False, "boot_failure"
+        except subprocess.TimeoutExpired:
+            return False, "boot_timeout"
+        except subprocess.CalledProcessError:
+            return False, "boot_failure"
+
+    def _wait_for_boot_completion(self, timeout=180):
+        """
+        等待设备启动完成
+        启动过程中adbd可能重启或USB重新枚举导致shell断开，此时重新等待设备上线并再次检查，
+        直到超时才返回最后一次的失败状态
+        """
+        deadline = time.time() + timeout
+        status = "boot_timeout"
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False, status
+
+            success, status = self._cmd_wait_for_device(remaining)
+            if success:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False, "boot_timeout"
+                success, status = self._cmd_boot_completed(remaining)
+                if success:
+                    return True, status
+
+            # 连接断开后稍等再重试，避免失败时频繁启动adb进程
+            time.sleep(min(1, max(0, deadline - time.time())))
+
+    @staticmethod
+    def _fmt_ts(t):
+        """将time.time()时间戳格式化为本地时间字符串，None输出为空"""
+        return '' if t is None else time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+
+    @classmethod
+    def _format_row(cls, r):
+        """按固定列顺序格式化一行CSV，仅error_message可能含逗号或引号，需加引号转义"""
+        error_message = (r['error_message'] or '').replace('"', '""')
+        duration = '' if r['duration_seconds'] is None else r['duration_seconds']
+        return (
+            f"{r['cycle']},{cls._fmt_ts(r['start_time'])},{cls._fmt_ts(r['end_time'])},"
+            f"{r['status']},{r['error_type'] or ''},"
+            f"\"{error_message}\",{duration}\r\n"
+        )
+
+    def _writer_loop(self):
+        """后台写入线程：从队列取出结果写入CSV，收到None时退出"""
+        while True:
+            test_result = self._q.get()
+            if test_result is None:
+                break
+            try:
+                self._csv_fh.write(self._format_row(test_result))
+            except Exception as e:
+                print(f"写入结果失败: {e}")
+
+    def _record_result(self, test_result):
+        """提交一行测试结果到写入队列并更新计数"""
+        self._q.put(test_result)
+        self._total += 1
+        if test_result['status'] == 'OK':
+            self._success += 1
 
     def perform_reboot(self):
         """执行一次完整的重启测试并记录详细异常信息"""
+        # 时间字段保存为时间戳，写入CSV时再格式化
+        start_time = time.time()
         test_result = {
             'cycle': self.current_cycle + 1,
-            'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'reboot_success': False,
-            'boot_success': False,
+            'start_time': start_time,
+            'status': 'REBOOT_FAIL',
             'error_type': None,
             'error_message': None,
             'duration_seconds': None,
@@ -111,19 +277,18 @@ class PhoneRebootTester:
 
         try:
             print(f"\n开始测试循环 #{test_result['cycle']}/{self.test_cycles}")
-            start_time = time.time()
             
             # 执行重启命令
             print("执行重启...")
-            success, error_type = self._execute_adb_command(['reboot'])
+            success, error_type = self._cmd_reboot()
             if not success:
                 test_result['error_type'] = error_type
-                test_result['error_message'] = self.error_types.get(error_type, "未知错误")
+                test_result['error_message'] = self._ERROR_TYPES.get(error_type, "未知错误")
                 self.error_stats[error_type] += 1
-                self.results.append(test_result)
+                self._record_result(test_result)
                 return False
             
-            test_result['reboot_success'] = True
+            test_result['status'] = 'BOOT_FAIL'
             
             # 等待设备重启完成
             print("等待设备重启...")
@@ -131,17 +296,18 @@ class PhoneRebootTester:
             
             if not boot_success:
                 test_result['error_type'] = boot_status
-                test_result['error_message'] = self.error_types.get(boot_status, "未知启动错误")
+                test_result['error_message'] = self._ERROR_TYPES.get(boot_status, "未知启动错误")
                 self.error_stats[boot_status] += 1
-                self.results.append(test_result)
+                self._record_result(test_result)
                 return False
             
-            test_result['boot_success'] = True
-            test_result['duration_seconds'] = round(time.time() - start_time, 2)
-            test_result['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            test_result['status'] = 'OK'
+            end_time = time.time()
+            test_result['duration_seconds'] = round(end_time - start_time, 2)
+            test_result['end_time'] = end_time
             
             print(f"重启测试 #{test_result['cycle']} 完成, 耗时 {test_result['duration_seconds']}秒")
-            self.results.append(test_result)
+            self._record_result(test_result)
             return True
             
         except Exception as e:
@@ -149,31 +315,18 @@ class PhoneRebootTester:
             test_result['error_type'] = error_type
             test_result['error_message'] = f"未分类异常: {str(e)}"
             self.error_stats[error_type] += 1
-            self.results.append(test_result)
+            self._record_result(test_result)
             return False
 
     def save_results(self):
-        """将测试结果保存到CSV文件（解决中文乱码版本）"""
-        if not self.results:
-            print("没有测试结果可保存")
-            return False
-
+        """将已追加的测试结果刷新到CSV文件（utf-8-sig编码，解决中文乱码），仅在测试结束时调用"""
         try:
-            with open(self.output_file, mode='w', newline='', encoding='utf-8-sig') as f:
-                fieldnames = [
-                    'cycle', 
-                    'start_time', 
-                    'end_time',
-                    'reboot_success',
-                    'boot_success',
-                    'error_type',
-                    'error_message',
-                    'duration_seconds'
-                ]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(self.results)
-            
+            self._csv_fh.flush()
+            if self.fsync_on_close:
+                os.fsync(self._csv_raw.fileno())
+            if not self._total:
+                print("没有测试结果可保存")
+                return False
             print(f"\n测试结果已保存到 {self.output_file}")
             return True
         except Exception as e:
@@ -182,12 +335,12 @@ class PhoneRebootTester:
 
     def print_summary(self):
         """打印测试摘要和错误统计"""
-        if not self.results:
+        if not self._total:
             print("没有可用的测试结果")
             return
 
-        total = len(self.results)
-        success = sum(1 for r in self.results if r['reboot_success'] and r['boot_success'])
+        total = self._total
+        success = self._success
         failures = total - success
 
         print("\n测试摘要:")
@@ -198,8 +351,9 @@ class PhoneRebootTester:
 
         if self.error_stats:
             print("\n错误统计:")
-            for error_type, count in sorted(self.error_stats.items(), key=lambda x: x[1], reverse=True):
-                print(f"{self.error_types.get(error_type, '未知错误')}: {count}次 ({(count/total)*100:.1f}%)")
+            pct = 100.0 / total
+            for error_type, count in sorted(self.error_stats.items(), key=operator.itemgetter(1), reverse=True):
+                print(f"{self._ERROR_TYPES.get(error_type, '未知错误')}: {count}次 ({count * pct:.1f}%)")
 
     def run(self):
         """运行完整的测试套件"""
@@ -211,20 +365,19 @@ class PhoneRebootTester:
                 self.perform_reboot()
                 self.current_cycle += 1
                 
-                # 每10次循环保存一次中间结果
-                if self.current_cycle % 10 == 0:
-                    self.save_results()
-                    self.print_summary()  # 定期显示进度
-                
-                # 短暂的冷却时间
-                time.sleep(2)
+                # 可选的冷却时间
+                if self.cooldown_seconds:
+                    time.sleep(self.cooldown_seconds)
                 
         except KeyboardInterrupt:
             print("\n测试被用户中断")
         except Exception as e:
             print(f"\n测试遇到错误: {e}")
         finally:
+            self._q.put(None)
+            self._writer_thread.join()
             self.save_results()
+            self._csv_fh.close()  # 依次关闭TextIOWrapper、BufferedWriter和底层文件
             self.print_summary()
 
 